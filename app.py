@@ -4,7 +4,7 @@ import io
 import base64
 from datetime import datetime, timedelta
 from functools import wraps
-from flask import Flask, render_template, request, redirect, url_for, flash, Response
+from flask import Flask, render_template, stream_template, get_flashed_messages, request, redirect, url_for, flash, Response
 from sqlalchemy import func, extract
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from flask_mail import Mail, Message
@@ -18,6 +18,7 @@ import matplotlib.pyplot as plt
 # Importações locais
 from database import db
 from models import Usuario, Veiculo, Funcionario, Abastecimento, Manutencao, DespesaGeral, Receita
+from compressao import agrupar_em_blocos, comprimir_resposta
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
@@ -48,6 +49,19 @@ login_manager.login_message_category = "info"
 def load_user(user_id):
     return db.session.get(Usuario, int(user_id))
 
+# Comprime (gzip/brotli) as páginas HTML conforme o Accept-Encoding do navegador
+app.after_request(comprimir_resposta)
+
+# Quantidade de linhas carregadas do banco por vez nas listagens em stream
+LINHAS_POR_LOTE = 500
+
+# --- RENDERIZAÇÃO EM STREAM ---
+def renderizar_em_stream(template, **contexto):
+    # Consome as mensagens flash antes de enviar a resposta; caso contrário a sessão
+    # já teria sido salva quando o template as lesse, e elas apareceriam de novo.
+    get_flashed_messages()
+    return Response(agrupar_em_blocos(stream_template(template, **contexto)), mimetype='text/html')
+
 # --- FUNÇÕES AUXILIARES PARA GRÁFICOS ---
 def gerar_grafico_pizza(labels, data, titulo):
     if not data: return None
@@ -135,6 +149,71 @@ def home():
     chart_data = list(gastos_por_categoria.values())
     return render_template('index.html', total_veiculos=Veiculo.query.count(), total_funcionarios=Funcionario.query.filter_by(ativo=True).count(), total_gastos_mes=round(total_gastos_mes, 2), total_receitas_mes=round(total_receitas_mes, 2), saldo_mes=saldo_mes, chart_labels=chart_labels, chart_data=chart_data)
 
+# --- COLETA DE DADOS DO RELATÓRIO (usada pelo PDF e pela prévia em HTML) ---
+def coletar_dados_relatorio(data_inicio, data_fim):
+    # 1. Resumo Geral
+    total_receitas = db.session.query(func.sum(Receita.valor)).filter(Receita.data.between(data_inicio, data_fim)).scalar() or 0.0
+    total_combustivel = db.session.query(func.sum(Abastecimento.valor_total)).filter(Abastecimento.data.between(data_inicio, data_fim)).scalar() or 0.0
+    total_manutencao = db.session.query(func.sum(Manutencao.custo)).filter(Manutencao.data.between(data_inicio, data_fim)).scalar() or 0.0
+    total_despesas_gerais = db.session.query(func.sum(DespesaGeral.valor)).filter(DespesaGeral.data.between(data_inicio, data_fim)).scalar() or 0.0
+    total_despesas = total_combustivel + total_manutencao + total_despesas_gerais
+
+    resumo_financeiro = {
+        "total_receitas": total_receitas,
+        "total_despesas": total_despesas,
+        "saldo": total_receitas - total_despesas
+    }
+
+    # 2. Dados para Gráficos
+    gastos_por_categoria = {}
+    if total_combustivel > 0: gastos_por_categoria['Combustível'] = total_combustivel
+    if total_manutencao > 0: gastos_por_categoria['Manutenção'] = total_manutencao
+    despesas_gerais_agrupadas = db.session.query(DespesaGeral.categoria, func.sum(DespesaGeral.valor)).filter(DespesaGeral.data.between(data_inicio, data_fim)).group_by(DespesaGeral.categoria).all()
+    for categoria, total in despesas_gerais_agrupadas:
+        if total and total > 0: gastos_por_categoria[categoria] = gastos_por_categoria.get(categoria, 0) + total
+
+    # 3. Detalhamento de Despesas e Receitas
+    despesas_combustivel_detalhe = Abastecimento.query.filter(Abastecimento.data.between(data_inicio, data_fim)).all()
+    despesas_manutencao_detalhe = Manutencao.query.filter(Manutencao.data.between(data_inicio, data_fim)).all()
+    despesas_gerais_detalhe = DespesaGeral.query.filter(DespesaGeral.data.between(data_inicio, data_fim)).all()
+
+    lista_despesas_unificada = []
+    for item in despesas_combustivel_detalhe:
+        lista_despesas_unificada.append({'data': item.data, 'tipo': 'Combustível', 'descricao': f"{item.litros:.2f}L", 'veiculo_placa': item.veiculo.placa, 'valor': item.valor_total})
+    for item in despesas_manutencao_detalhe:
+         lista_despesas_unificada.append({'data': item.data, 'tipo': 'Manutenção', 'descricao': item.descricao_servico, 'veiculo_placa': item.veiculo.placa, 'valor': item.custo})
+    for item in despesas_gerais_detalhe:
+         lista_despesas_unificada.append({'data': item.data, 'tipo': item.categoria, 'descricao': item.descricao, 'veiculo_placa': None, 'valor': item.valor})
+    lista_despesas_unificada.sort(key=lambda x: x['data'])
+    receitas_detalhe = Receita.query.filter(Receita.data.between(data_inicio, data_fim)).order_by(Receita.data).all()
+    detalhamento_geral = { "despesas": lista_despesas_unificada, "receitas": receitas_detalhe }
+
+    # 4. Detalhamento por Veículo
+    todos_veiculos = Veiculo.query.all()
+    detalhamento_por_veiculo = []
+    for veiculo in todos_veiculos:
+        v_abastecimentos = Abastecimento.query.filter(Abastecimento.id_veiculo == veiculo.id, Abastecimento.data.between(data_inicio, data_fim)).all()
+        v_manutencoes = Manutencao.query.filter(Manutencao.id_veiculo == veiculo.id, Manutencao.data.between(data_inicio, data_fim)).all()
+        v_receitas = Receita.query.filter(Receita.id_veiculo == veiculo.id, Receita.data.between(data_inicio, data_fim)).all()
+
+        if v_abastecimentos or v_manutencoes or v_receitas:
+            detalhamento_por_veiculo.append({
+                "placa": veiculo.placa, "modelo": veiculo.modelo,
+                "total_combustivel": sum(a.valor_total for a in v_abastecimentos),
+                "total_manutencao": sum(m.custo for m in v_manutencoes),
+                "total_receita": sum(r.valor for r in v_receitas),
+                "abastecimentos": v_abastecimentos, "manutencoes": v_manutencoes
+            })
+
+    # --- GERAÇÃO DOS GRÁFICOS ---
+    grafico_gastos = gerar_grafico_pizza(labels=list(gastos_por_categoria.keys()), data=list(gastos_por_categoria.values()), titulo='Distribuição de Gastos por Categoria')
+    grafico_receita_despesa = gerar_grafico_barras(labels=['Receitas', 'Despesas'], data=[resumo_financeiro['total_receitas'], resumo_financeiro['total_despesas']], titulo='Comparativo: Receitas vs. Despesas')
+
+    return dict(data_inicio=data_inicio.strftime('%d/%m/%Y'), data_fim=data_fim.strftime('%d/%m/%Y'),
+        data_emissao=datetime.now().strftime('%d/%m/%Y'), resumo=resumo_financeiro,
+        detalhamento=detalhamento_geral, detalhamento_veiculos=detalhamento_por_veiculo,
+        grafico_gastos_categoria=grafico_gastos, grafico_receita_despesa=grafico_receita_despesa)
+
 # --- ROTAS DE RELATÓRIOS (NOVO SISTEMA) ---
 @app.route('/relatorios', methods=['GET', 'POST'])
 @login_required
@@ -147,71 +226,10 @@ def relatorios():
             data_inicio = datetime.strptime(data_inicio_str, '%Y-%m-%d').date()
             data_fim = datetime.strptime(data_fim_str, '%Y-%m-%d').date()
 
-            # --- COLETA DE DADOS ---
-            # 1. Resumo Geral
-            total_receitas = db.session.query(func.sum(Receita.valor)).filter(Receita.data.between(data_inicio, data_fim)).scalar() or 0.0
-            total_combustivel = db.session.query(func.sum(Abastecimento.valor_total)).filter(Abastecimento.data.between(data_inicio, data_fim)).scalar() or 0.0
-            total_manutencao = db.session.query(func.sum(Manutencao.custo)).filter(Manutencao.data.between(data_inicio, data_fim)).scalar() or 0.0
-            total_despesas_gerais = db.session.query(func.sum(DespesaGeral.valor)).filter(DespesaGeral.data.between(data_inicio, data_fim)).scalar() or 0.0
-            total_despesas = total_combustivel + total_manutencao + total_despesas_gerais
-            
-            resumo_financeiro = {
-                "total_receitas": total_receitas,
-                "total_despesas": total_despesas,
-                "saldo": total_receitas - total_despesas
-            }
-
-            # 2. Dados para Gráficos
-            gastos_por_categoria = {}
-            if total_combustivel > 0: gastos_por_categoria['Combustível'] = total_combustivel
-            if total_manutencao > 0: gastos_por_categoria['Manutenção'] = total_manutencao
-            despesas_gerais_agrupadas = db.session.query(DespesaGeral.categoria, func.sum(DespesaGeral.valor)).filter(DespesaGeral.data.between(data_inicio, data_fim)).group_by(DespesaGeral.categoria).all()
-            for categoria, total in despesas_gerais_agrupadas:
-                if total and total > 0: gastos_por_categoria[categoria] = gastos_por_categoria.get(categoria, 0) + total
-            
-            # 3. Detalhamento de Despesas e Receitas
-            despesas_combustivel_detalhe = Abastecimento.query.filter(Abastecimento.data.between(data_inicio, data_fim)).all()
-            despesas_manutencao_detalhe = Manutencao.query.filter(Manutencao.data.between(data_inicio, data_fim)).all()
-            despesas_gerais_detalhe = DespesaGeral.query.filter(DespesaGeral.data.between(data_inicio, data_fim)).all()
-            
-            lista_despesas_unificada = []
-            for item in despesas_combustivel_detalhe:
-                lista_despesas_unificada.append({'data': item.data, 'tipo': 'Combustível', 'descricao': f"{item.litros:.2f}L", 'veiculo_placa': item.veiculo.placa, 'valor': item.valor_total})
-            for item in despesas_manutencao_detalhe:
-                 lista_despesas_unificada.append({'data': item.data, 'tipo': 'Manutenção', 'descricao': item.descricao_servico, 'veiculo_placa': item.veiculo.placa, 'valor': item.custo})
-            for item in despesas_gerais_detalhe:
-                 lista_despesas_unificada.append({'data': item.data, 'tipo': item.categoria, 'descricao': item.descricao, 'veiculo_placa': None, 'valor': item.valor})
-            lista_despesas_unificada.sort(key=lambda x: x['data'])
-            receitas_detalhe = Receita.query.filter(Receita.data.between(data_inicio, data_fim)).order_by(Receita.data).all()
-            detalhamento_geral = { "despesas": lista_despesas_unificada, "receitas": receitas_detalhe }
-
-            # 4. Detalhamento por Veículo
-            todos_veiculos = Veiculo.query.all()
-            detalhamento_por_veiculo = []
-            for veiculo in todos_veiculos:
-                v_abastecimentos = Abastecimento.query.filter(Abastecimento.id_veiculo == veiculo.id, Abastecimento.data.between(data_inicio, data_fim)).all()
-                v_manutencoes = Manutencao.query.filter(Manutencao.id_veiculo == veiculo.id, Manutencao.data.between(data_inicio, data_fim)).all()
-                v_receitas = Receita.query.filter(Receita.id_veiculo == veiculo.id, Receita.data.between(data_inicio, data_fim)).all()
-
-                if v_abastecimentos or v_manutencoes or v_receitas:
-                    detalhamento_por_veiculo.append({
-                        "placa": veiculo.placa, "modelo": veiculo.modelo,
-                        "total_combustivel": sum(a.valor_total for a in v_abastecimentos),
-                        "total_manutencao": sum(m.custo for m in v_manutencoes),
-                        "total_receita": sum(r.valor for r in v_receitas),
-                        "abastecimentos": v_abastecimentos, "manutencoes": v_manutencoes
-                    })
-
-            # --- GERAÇÃO DOS GRÁFICOS ---
-            grafico_gastos = gerar_grafico_pizza(labels=list(gastos_por_categoria.keys()), data=list(gastos_por_categoria.values()), titulo='Distribuição de Gastos por Categoria')
-            grafico_receita_despesa = gerar_grafico_barras(labels=['Receitas', 'Despesas'], data=[resumo_financeiro['total_receitas'], resumo_financeiro['total_despesas']], titulo='Comparativo: Receitas vs. Despesas')
+            dados_relatorio = coletar_dados_relatorio(data_inicio, data_fim)
 
             # --- RENDERIZAÇÃO DO HTML PARA O PDF ---
-            html_renderizado = render_template('relatorio_pdf.html',
-                data_inicio=data_inicio.strftime('%d/%m/%Y'), data_fim=data_fim.strftime('%d/%m/%Y'),
-                data_emissao=datetime.now().strftime('%d/%m/%Y'), resumo=resumo_financeiro,
-                detalhamento=detalhamento_geral, detalhamento_veiculos=detalhamento_por_veiculo,
-                grafico_gastos_categoria=grafico_gastos, grafico_receita_despesa=grafico_receita_despesa)
+            html_renderizado = render_template('relatorio_pdf.html', **dados_relatorio)
             
             pdf = HTML(string=html_renderizado).write_pdf()
             return Response(pdf, mimetype='application/pdf', headers={'Content-Disposition': 'attachment;filename=relatorio_scala_gestao.pdf'})
@@ -223,6 +241,20 @@ def relatorios():
 
     return render_template('relatorios.html')
 
+@app.route('/relatorios/previa', methods=['POST'])
+@login_required
+def previa_relatorio():
+    # Mesma página do PDF, porém enviada em stream para o navegador, sem passar pelo WeasyPrint
+    try:
+        data_inicio = datetime.strptime(request.form['data_inicio'], '%Y-%m-%d').date()
+        data_fim = datetime.strptime(request.form['data_fim'], '%Y-%m-%d').date()
+        dados_relatorio = coletar_dados_relatorio(data_inicio, data_fim)
+    except Exception as e:
+        print(f"--- ERRO AO GERAR PRÉVIA DO RELATÓRIO: {e} ---")
+        flash("Ocorreu um erro ao gerar a prévia do relatório. Verifique as datas e tente novamente.", "danger")
+        return redirect(url_for('relatorios'))
+    return renderizar_em_stream('relatorio_pdf.html', **dados_relatorio)
+
 
 @app.route('/relatorio/enviar')
 @login_required
@@ -259,8 +291,8 @@ def enviar_relatorio():
 @app.route('/frota')
 @login_required
 def frota():
-    todos_veiculos = Veiculo.query.order_by(Veiculo.placa).all()
-    return render_template('frota.html', lista_de_veiculos=todos_veiculos)
+    todos_veiculos = Veiculo.query.order_by(Veiculo.placa).yield_per(LINHAS_POR_LOTE)
+    return renderizar_em_stream('frota.html', lista_de_veiculos=todos_veiculos)
 
 @app.route('/veiculo/novo', methods=['GET', 'POST'])
 @login_required
@@ -301,8 +333,8 @@ def excluir_veiculo(id):
 @app.route('/funcionarios')
 @login_required
 def funcionarios():
-    todos_funcionarios = Funcionario.query.order_by(Funcionario.nome).all()
-    return render_template('funcionarios.html', lista_de_funcionarios=todos_funcionarios)
+    todos_funcionarios = Funcionario.query.order_by(Funcionario.nome).yield_per(LINHAS_POR_LOTE)
+    return renderizar_em_stream('funcionarios.html', lista_de_funcionarios=todos_funcionarios)
 
 @app.route('/funcionario/novo', methods=['GET', 'POST'])
 @login_required
@@ -355,8 +387,8 @@ def excluir_funcionario(id):
 @app.route('/abastecimentos')
 @login_required
 def abastecimentos():
-    lista_abastecimentos = Abastecimento.query.order_by(Abastecimento.data.desc()).all()
-    return render_template('abastecimentos.html', abastecimentos=lista_abastecimentos)
+    lista_abastecimentos = Abastecimento.query.order_by(Abastecimento.data.desc()).yield_per(LINHAS_POR_LOTE)
+    return renderizar_em_stream('abastecimentos.html', abastecimentos=lista_abastecimentos)
 
 @app.route('/abastecimento/novo', methods=['GET', 'POST'])
 @login_required
@@ -407,8 +439,8 @@ def excluir_abastecimento(id):
 @app.route('/manutencoes')
 @login_required
 def manutencoes():
-    lista_manutencoes = Manutencao.query.order_by(Manutencao.data.desc()).all()
-    return render_template('manutencoes.html', manutencoes=lista_manutencoes)
+    lista_manutencoes = Manutencao.query.order_by(Manutencao.data.desc()).yield_per(LINHAS_POR_LOTE)
+    return renderizar_em_stream('manutencoes.html', manutencoes=lista_manutencoes)
 
 @app.route('/manutencao/novo', methods=['GET', 'POST'])
 @login_required
@@ -456,8 +488,8 @@ def excluir_manutencao(id):
 @app.route('/despesas')
 @login_required
 def despesas():
-    lista_despesas = DespesaGeral.query.order_by(DespesaGeral.data.desc()).all()
-    return render_template('despesas.html', despesas=lista_despesas)
+    lista_despesas = DespesaGeral.query.order_by(DespesaGeral.data.desc()).yield_per(LINHAS_POR_LOTE)
+    return renderizar_em_stream('despesas.html', despesas=lista_despesas)
 
 @app.route('/despesa/novo', methods=['GET', 'POST'])
 @login_required
@@ -501,8 +533,8 @@ def excluir_despesa(id):
 @app.route('/receitas')
 @login_required
 def receitas():
-    lista_receitas = Receita.query.order_by(Receita.data.desc()).all()
-    return render_template('receitas.html', receitas=lista_receitas)
+    lista_receitas = Receita.query.order_by(Receita.data.desc()).yield_per(LINHAS_POR_LOTE)
+    return renderizar_em_stream('receitas.html', receitas=lista_receitas)
 
 @app.route('/receita/novo', methods=['GET', 'POST'])
 @login_required
@@ -0,0 +1,82 @@
+# compressao.py
+import zlib
+from flask import request
+
+# Brotli é opcional: se não estiver instalado, usamos apenas gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Tamanho mínimo (em bytes) para valer a pena comprimir uma resposta comum
+TAMANHO_MINIMO = 500
+# Tamanho dos blocos enviados ao navegador nas respostas em stream
+TAMANHO_BLOCO = 8 * 1024
+
+
+def agrupar_em_blocos(partes, tamanho=TAMANHO_BLOCO):
+    """Junta os pedaços pequenos gerados pelo Jinja em blocos de ~8 KB."""
+    buffer = []
+    acumulado = 0
+    for parte in partes:
+        if isinstance(parte, str):
+            parte = parte.encode('utf-8')
+        buffer.append(parte)
+        acumulado += len(parte)
+        if acumulado >= tamanho:
+            yield b''.join(buffer)
+            buffer = []
+            acumulado = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def escolher_codificacao():
+    """Negocia a codificação com o cabeçalho Accept-Encoding da requisição."""
+    opcoes = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return request.accept_encodings.best_match(opcoes)
+
+
+def novo_compressor(codificacao):
+    """Retorna as funções (comprimir_bloco, finalizar) para a codificação escolhida."""
+    if codificacao == 'br':
+        compressor = brotli.Compressor(mode=brotli.MODE_TEXT, quality=5)
+        return (lambda bloco: compressor.process(bloco) + compressor.flush()), compressor.finish
+    # wbits=31 gera o formato gzip (cabeçalho + deflate + CRC)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    return (lambda bloco: compressor.compress(bloco) + compressor.flush(zlib.Z_SYNC_FLUSH)), compressor.flush
+
+
+def comprimir_stream(blocos, codificacao):
+    # Cada bloco é "descarregado" (flush) para que o navegador já consiga exibir as primeiras linhas
+    comprimir_bloco, finalizar = novo_compressor(codificacao)
+    for bloco in agrupar_em_blocos(blocos):
+        dados = comprimir_bloco(bloco)
+        if dados:
+            yield dados
+    yield finalizar()
+
+
+def comprimir_resposta(response):
+    """Comprime respostas HTML com gzip/brotli conforme o que o navegador aceita."""
+    if (response.status_code != 200 or response.mimetype != 'text/html'
+            or 'Content-Encoding' in response.headers or response.direct_passthrough):
+        return response
+
+    response.vary.add('Accept-Encoding')
+    codificacao = escolher_codificacao()
+    if not codificacao:
+        return response
+
+    if response.is_streamed:
+        response.response = comprimir_stream(response.response, codificacao)
+        response.headers.pop('Content-Length', None)
+    else:
+        dados = response.get_data()
+        if len(dados) < TAMANHO_MINIMO:
+            return response
+        comprimir_bloco, finalizar = novo_compressor(codificacao)
+        response.set_data(comprimir_bloco(dados) + finalizar())
+
+    response.headers['Content-Encoding'] = codificacao
+    return response